@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -8,16 +10,66 @@ load_dotenv()
 
 # Get database URL from environment variable, default to SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+_DATABASE_URL = make_url(DATABASE_URL)
+# Heroku-style postgres:// URLs name the same backend
+IS_POSTGRES = _DATABASE_URL.get_backend_name() in ("postgresql", "postgres")
+
+# Connection pool settings (tunable per deployment without code changes)
+# pre-ping + recycle apply to every backend so stale connections never reach a request
+POOL_KWARGS = {
+    "pool_pre_ping": True,
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+}
+# Pool sizing only applies to PostgreSQL's QueuePool
+POOL_SIZE_KWARGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "40")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+}
+# The async pool only serves the agent's consequence lookups, so it is sized separately
+# (both pools are held per worker and count against Postgres max_connections)
+ASYNC_POOL_SIZE_KWARGS = {
+    "pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "10")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+}
 
 # Configure engine based on database type
-if DATABASE_URL.startswith("postgresql"):
+if IS_POSTGRES:
     # PostgreSQL configuration
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=10, max_overflow=20)
+    sync_url = _DATABASE_URL
+    if sync_url.drivername == "postgres":
+        sync_url = sync_url.set(drivername="postgresql")
+    engine = create_engine(sync_url, **POOL_KWARGS, **POOL_SIZE_KWARGS)
 else:
     # SQLite configuration (for development)
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, **POOL_KWARGS)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for request-path queries inside async handlers (agent graph nodes)
+# (swap whatever sync driver the URL names for the async one)
+if IS_POSTGRES:
+    ASYNC_DATABASE_URL = _DATABASE_URL.set(drivername="postgresql+asyncpg")
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **POOL_KWARGS, **ASYNC_POOL_SIZE_KWARGS)
+else:
+    ASYNC_DATABASE_URL = _DATABASE_URL.set(drivername="sqlite+aiosqlite")
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **POOL_KWARGS)
+
+# SQLite tuning: WAL lets readers proceed while a writer commits
+def _set_sqlite_pragmas(dbapi_conn, _connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+if not IS_POSTGRES:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 def get_db():
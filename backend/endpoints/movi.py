@@ -3,19 +3,61 @@ Movi API Endpoint
 FastAPI routes for Movi AI assistant
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-from langchain_core.messages import HumanMessage
+from typing import AsyncIterator, Optional
+from langchain_core.prompts import ChatPromptTemplate
 from langgraph.types import Command
-import sys
+from langchain_openai import ChatOpenAI
+import orjson
+import logging
 import os
+from dotenv import load_dotenv
+
+try:
+    from livekit import api
+except ImportError:  # Voice chat is optional
+    api = None
+
+from intelligence.graph import app as agent_graph, extract_interrupt
+from utils.history import tail_messages
 
-sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+load_dotenv()
 
-from intelligence.graph import app as agent_graph
+logger = logging.getLogger(__name__)
+
+# LiveKit credentials are read once; voice tokens are only served when all are set
+_LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+_LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
+_LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+_LIVEKIT_CONFIGURED = bool(_LIVEKIT_URL and _LIVEKIT_API_KEY and _LIVEKIT_API_SECRET)
 
 router = APIRouter(prefix="/movi", tags=["movi"])
 
+# Replies that approve a pending high-impact action
+_APPROVAL_TOKENS = frozenset({
+    "yes", "y", "proceed", "confirm", "ok", "okay", "yeah", "yep", "sure", "approve"
+})
+
+# LLM for HITL confirmation alerts, created once so its HTTP client is reused
+_confirmation_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
+
+# Prompt for the AI-written HITL confirmation alert
+_CONFIRM_PROMPT = ChatPromptTemplate.from_template("""You are a helpful assistant generating a confirmation alert for a user action.
+
+The user is about to: {tool_name}
+Affected entity: {affected_entity}
+
+Consequences:
+{details}
+
+Generate a clear, concise, and friendly confirmation message that:
+1. Explains what will happen if they proceed
+2. Highlights the key consequences
+3. Asks if they want to continue
+
+Keep it under 3-4 sentences. Be direct but respectful.""")
+
 class ChatRequest(BaseModel):
     message: str
     session_id: str
@@ -29,8 +71,74 @@ class ChatResponse(BaseModel):
     awaiting_confirmation: bool = False
     audio_base64: Optional[str] = None
 
-from fastapi.responses import StreamingResponse
-import json
+def _build_turn_input(request: ChatRequest, state) -> dict:
+    """Build the graph input for a new user turn, carrying recent history forward."""
+    existing_messages = tail_messages(state.values.get("messages", []) if state.values else [])
+    
+    return {
+        "user_msg": request.message,
+        "current_page": request.context_page or "unknown",
+        "messages": existing_messages,
+        "image_base64": request.image_base64,
+        "image_content": None,
+        "intent": None,
+        "tool_name": None,
+        "entities": None,
+        "needs_user_input": False,
+        "consequences": None,
+        "awaiting_confirmation": False,
+        "tool_result": None,
+        "response": None
+    }
+
+
+async def _build_confirmation_payload(consequence_data, values: dict) -> dict:
+    """Build the HITL confirmation payload (AI-written alert) for an interrupted graph."""
+    # Alternative: check if consequence_data is in state values
+    if not consequence_data and values.get("consequences"):
+        consequence_data = values["consequences"]
+    
+    # Fallback: construct from state if available
+    if not consequence_data:
+        tool_name = values.get("tool_name")
+        entities = values.get("entities", {})
+        if tool_name:
+            consequence_data = {
+                "type": "confirmation_required",
+                "tool_name": tool_name,
+                "entities": entities,
+                "has_consequences": True,
+                "details": f"Action '{tool_name}' requires confirmation."
+            }
+    
+    # Generate AI alert based on consequences
+    if consequence_data and consequence_data.get("has_consequences"):
+        # Use AI to generate a natural, context-aware confirmation message
+        details = consequence_data.get("details", "")
+        tool_name = consequence_data.get("tool_name", "this action")
+        affected_entity = consequence_data.get("affected_entity", "")
+        
+        messages = _CONFIRM_PROMPT.format_messages(
+            tool_name=tool_name,
+            affected_entity=affected_entity,
+            details=details
+        )
+        ai_alert = (await _confirmation_llm.ainvoke(messages)).content
+        
+        payload = {
+            "requires_confirmation": True,
+            "message": ai_alert
+        }
+    else:
+        # Fallback for tools without specific consequences
+        tool_name = consequence_data.get("tool_name", "this action") if consequence_data else "this action"
+        payload = {
+            "requires_confirmation": True,
+            "message": f"You are about to execute: {tool_name}\n\nDo you want to proceed? (yes/no)"
+        }
+
+    return payload
+
 
 @router.post("/chat")
 async def chat_with_movi(request: ChatRequest):
@@ -47,217 +155,146 @@ async def chat_with_movi(request: ChatRequest):
     # Config with thread_id for state persistence
     config = {"configurable": {"thread_id": request.session_id}}
     
-    async def event_generator():
+    async def event_generator() -> AsyncIterator[bytes]:
         try:
             # Check if there's an ongoing interrupt waiting for resume
-            state = agent_graph.get_state(config)
+            state = await agent_graph.aget_state(config)
             
             # Determine input for the graph
             if state.next:
                 # User is responding to an interrupt/confirmation request
-                user_approved = request.message.lower().strip() in [
-                    "yes", "y", "proceed", "confirm", "ok", "okay", "yeah", "yep", "sure", "approve"
-                ]
+                user_approved = request.message.strip().lower() in _APPROVAL_TOKENS
                 
-                # For resume, use invoke instead of astream (more reliable)
+                # For resume, use ainvoke instead of astream (more reliable)
                 try:
-                    # Small delay to ensure state is ready
-                    import asyncio
-                    await asyncio.sleep(0.1)
-                    
-                    result = agent_graph.invoke(Command(resume=user_approved), config=config)
-                    
-                    # Small delay before checking state
-                    await asyncio.sleep(0.1)
-                    
-                    # Get final state after resume
-                    final_state_after_resume = agent_graph.get_state(config)
-                    
-                    # Extract response from result or final state
-                    final_response = None
-                    
-                    # Try result first (invoke returns the final state values)
-                    if isinstance(result, dict):
-                        if "response" in result:
-                            final_response = result["response"]
-                        elif "tool_result" in result:
-                            # If no response but we have tool_result, generate a simple response
-                            tool_result = result["tool_result"]
-                            final_response = f"✅ {tool_result}" if user_approved else f"❌ Action cancelled: {tool_result}"
+                    # ainvoke returns the final state values, so no checkpoint reload is needed
+                    result = await agent_graph.ainvoke(Command(resume=user_approved), config=config)
                     
-                    # Try final state if result didn't have response
-                    if not final_response and final_state_after_resume.values:
-                        if "response" in final_state_after_resume.values:
-                            final_response = final_state_after_resume.values["response"]
-                        elif "tool_result" in final_state_after_resume.values:
-                            tool_result = final_state_after_resume.values["tool_result"]
-                            final_response = f"✅ {tool_result}" if user_approved else f"❌ Action cancelled: {tool_result}"
+                    final_response = result.get("response")
+                    if not final_response and result.get("tool_result"):
+                        # If no response but we have tool_result, generate a simple response
+                        tool_result = result["tool_result"]
+                        final_response = f"✅ {tool_result}" if user_approved else f"❌ Action cancelled: {tool_result}"
                     
                     # Fallback response
                     if not final_response:
                         final_response = "✅ Action completed successfully." if user_approved else "❌ Action cancelled by user."
                     
-                    # Stream the response
+                    # Send the response (already fully generated) as one frame
                     if final_response:
-                        chunk_size = 15
-                        for i in range(0, len(final_response), chunk_size):
-                            chunk = final_response[i:i+chunk_size]
-                            yield json.dumps({"type": "token", "content": chunk}) + "\n"
-                            import asyncio
-                            await asyncio.sleep(0.01)
+                        yield orjson.dumps({"type": "token", "content": final_response}) + b"\n"
                     else:
-                        yield json.dumps({"type": "error", "content": "No response after resume"}) + "\n"
+                        yield orjson.dumps({"type": "error", "content": "No response after resume"}) + b"\n"
                     
                     return  # Exit early after resume
                 except Exception as resume_error:
-                    import traceback
-                    traceback.print_exc()
-                    yield json.dumps({"type": "error", "content": f"Error resuming: {str(resume_error)}"}) + "\n"
+                    logger.exception("Movi resume failed")
+                    yield orjson.dumps({"type": "error", "content": f"Error resuming: {str(resume_error)}"}) + b"\n"
                     return
             else:
                 # Normal flow: new conversation
-                existing_messages = state.values.get("messages", []) if state.values else []
-                if len(existing_messages) > 10:
-                    existing_messages = existing_messages[-10:]
-                
-                input_data = {
-                    "user_msg": request.message,
-                    "current_page": request.context_page or "unknown",
-                    "messages": existing_messages,
-                    "image_base64": request.image_base64,
-                    "image_content": None,
-                    "intent": None,
-                    "tool_name": None,
-                    "entities": None,
-                    "needs_user_input": False,
-                    "consequences": None,
-                    "awaiting_confirmation": False,
-                    "tool_result": None
-                }
-
-            # Execute the graph and collect the final response
-            # Use astream to execute the graph step by step
-            final_response = None
+                input_data = _build_turn_input(request, state)
+
+            # Execute the graph in one call; nothing is streamed until the
+            # whole turn (or an interrupt) is known, so per-node events are not needed
+            # The result carries the final values and any pending interrupt
+            result = None
             
             try:
-                async for state_update in agent_graph.astream(input_data, config=config):
-                    # state_update is a dict where keys are node names
-                    # The response node will have the final response
-                    if "response" in state_update:
-                        node_output = state_update["response"]
-                        if isinstance(node_output, dict) and "response" in node_output:
-                            final_response = node_output["response"]
-            except Exception as stream_error:
-                import traceback
-                traceback.print_exc()
-
-            # Get final state to check for response or interrupt
-            try:
-                final_state = agent_graph.get_state(config)
-            except Exception as state_error:
-                yield json.dumps({"type": "error", "content": f"Error retrieving agent state: {str(state_error)}"}) + "\n"
-                return
+                result = await agent_graph.ainvoke(input_data, config=config)
+            except Exception:
+                logger.exception("Movi graph invocation failed")
+
+            # Only reload the checkpoint if the invocation itself failed
+            if not isinstance(result, dict):
+                try:
+                    final_state = await agent_graph.aget_state(config)
+                except Exception as state_error:
+                    yield orjson.dumps({"type": "error", "content": f"Error retrieving agent state: {str(state_error)}"}) + b"\n"
+                    return
+                interrupt_data = extract_interrupt(final_state) if final_state.next else None
+                values = final_state.values or {}
+            else:
+                interrupt_data = extract_interrupt(result)
+                values = result
             
             # IMPORTANT: Check for interrupt FIRST before trying to stream response
-            if final_state.next:
+            if interrupt_data is not None:
                 # We are interrupted (HITL) - need to generate AI alert
-                # Extract consequence data from interrupt payload
-                consequence_data = None
-                
-                # Try multiple ways to extract interrupt data
-                if hasattr(final_state, "tasks") and final_state.tasks:
-                    for task in final_state.tasks:
-                        if hasattr(task, "interrupts") and task.interrupts:
-                            consequence_data = task.interrupts[0].value
-                            break
-                
-                # Alternative: check if consequence_data is in state values
-                if not consequence_data and final_state.values:
-                    if "consequences" in final_state.values and final_state.values["consequences"]:
-                        consequence_data = final_state.values["consequences"]
+                payload = await _build_confirmation_payload(interrupt_data, values)
                 
-                # Fallback: construct from state if available
-                if not consequence_data and final_state.values:
-                    tool_name = final_state.values.get("tool_name")
-                    entities = final_state.values.get("entities", {})
-                    if tool_name:
-                        consequence_data = {
-                            "type": "confirmation_required",
-                            "tool_name": tool_name,
-                            "entities": entities,
-                            "has_consequences": True,
-                            "details": f"Action '{tool_name}' requires confirmation."
-                        }
-                
-                # Generate AI alert based on consequences
-                if consequence_data and consequence_data.get("has_consequences"):
-                    # Use AI to generate a natural, context-aware confirmation message
-                    from langchain_openai import ChatOpenAI
-                    
-                    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
-                    
-                    details = consequence_data.get("details", "")
-                    tool_name = consequence_data.get("tool_name", "this action")
-                    affected_entity = consequence_data.get("affected_entity", "")
-                    
-                    prompt = f"""You are a helpful assistant generating a confirmation alert for a user action.
-                    
-The user is about to: {tool_name}
-Affected entity: {affected_entity}
-
-Consequences:
-{details}
-
-Generate a clear, concise, and friendly confirmation message that:
-1. Explains what will happen if they proceed
-2. Highlights the key consequences
-3. Asks if they want to continue
-
-Keep it under 3-4 sentences. Be direct but respectful."""
-
-                    ai_alert = llm.invoke(prompt).content
-                    
-                    payload = {
-                        "requires_confirmation": True,
-                        "message": ai_alert
-                    }
-                else:
-                    # Fallback for tools without specific consequences
-                    tool_name = consequence_data.get("tool_name", "this action") if consequence_data else "this action"
-                    payload = {
-                        "requires_confirmation": True,
-                        "message": f"You are about to execute: {tool_name}\n\nDo you want to proceed? (yes/no)"
-                    }
-                
-                yield json.dumps({"type": "confirmation", "payload": payload}) + "\n"
+                yield orjson.dumps({"type": "confirmation", "payload": payload}) + b"\n"
                 return  # Exit early when interrupt is detected
             else:
-                # No interrupt - check for response in final state
-                if not final_response and final_state.values:
-                    if "response" in final_state.values:
-                        final_response = final_state.values["response"]
+                final_response = values.get("response")
                 
-                # Stream the response if we have one
+                # Send the response if we have one (real token streaming: /movi/stream)
                 if final_response:
-                    # Stream in chunks for better UX
-                    chunk_size = 15
-                    for i in range(0, len(final_response), chunk_size):
-                        chunk = final_response[i:i+chunk_size]
-                        yield json.dumps({"type": "token", "content": chunk}) + "\n"
-                        # Small delay to simulate streaming
-                        import asyncio
-                        await asyncio.sleep(0.01)
+                    yield orjson.dumps({"type": "token", "content": final_response}) + b"\n"
                 else:
-                    yield json.dumps({"type": "error", "content": "No response generated from agent"}) + "\n"
+                    yield orjson.dumps({"type": "error", "content": "No response generated from agent"}) + b"\n"
                 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
-            yield json.dumps({"type": "error", "content": str(e)}) + "\n"
+            logger.exception("Movi chat error")
+            yield orjson.dumps({"type": "error", "content": str(e)}) + b"\n"
 
     return StreamingResponse(event_generator(), media_type="application/x-ndjson")
 
 
+@router.post("/stream")
+async def stream_chat_with_movi(request: ChatRequest):
+    """
+    Chat with Movi over Server-Sent Events, streaming reply tokens as the LLM
+    generates them (same session semantics as /chat).
+    Events (each a JSON "data:" line):
+    - {"type": "token", "content": "..."} -> LLM tokens from the reply generator
+    - {"type": "confirmation", "payload": {...}} -> HITL confirmation request
+    - {"type": "error", "content": "..."} -> Errors
+    - {"type": "done"} -> End of turn
+    """
+    if agent_graph is None:
+        raise HTTPException(status_code=503, detail="Movi agent unavailable")
+
+    config = {"configurable": {"thread_id": request.session_id}}
+
+    def sse(event: dict) -> bytes:
+        return b"data: " + orjson.dumps(event) + b"\n\n"
+
+    async def event_stream() -> AsyncIterator[bytes]:
+        try:
+            state = await agent_graph.aget_state(config)
+
+            if state.next:
+                # User is responding to an interrupt/confirmation request
+                user_approved = request.message.strip().lower() in _APPROVAL_TOKENS
+                graph_input = Command(resume=user_approved)
+            else:
+                graph_input = _build_turn_input(request, state)
+
+            # "messages" mode yields LLM chunks; "updates" surfaces an interrupt
+            # without reloading the checkpoint afterwards
+            interrupt_data = None
+            async for mode, data in agent_graph.astream(graph_input, config=config, stream_mode=["messages", "updates"]):
+                if mode == "messages":
+                    chunk, metadata = data
+                    # Only forward the user-facing reply
+                    if metadata.get("langgraph_node") == "reply_generator" and chunk.content:
+                        yield sse({"type": "token", "content": chunk.content})
+                elif "__interrupt__" in data:
+                    interrupt_data = extract_interrupt(data)
+
+            if interrupt_data is not None:
+                payload = await _build_confirmation_payload(interrupt_data, {})
+                yield sse({"type": "confirmation", "payload": payload})
+
+            yield sse({"type": "done"})
+        except Exception as e:
+            logger.exception("Movi stream error")
+            yield sse({"type": "error", "content": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 # ========== VOICE CHAT TOKEN ==========
 class VoiceTokenRequest(BaseModel):
     session_id: str
@@ -278,15 +315,13 @@ async def get_voice_token(request: VoiceTokenRequest):
     Creates a room for this session and returns a token for the user to join.
     """
     try:
-        from livekit import api
-        import os
-        
-        # Get LiveKit credentials
-        livekit_url = os.getenv("LIVEKIT_URL")
-        livekit_api_key = os.getenv("LIVEKIT_API_KEY")
-        livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
+        if api is None:
+            raise HTTPException(
+                status_code=500,
+                detail="LiveKit SDK not installed"
+            )
         
-        if not all([livekit_url, livekit_api_key, livekit_api_secret]):
+        if not _LIVEKIT_CONFIGURED:
             raise HTTPException(
                 status_code=500,
                 detail="LiveKit credentials not configured"
@@ -295,8 +330,14 @@ async def get_voice_token(request: VoiceTokenRequest):
         # Room name based on session ID
         room_name = f"movi-{request.session_id}"
         
+        # Room metadata for the voice agent (encoded, so quotes in ids stay valid JSON)
+        metadata = orjson.dumps({
+            "context_page": request.context_page,
+            "session_id": request.session_id,
+        }).decode()
+        
         # Create token with room metadata
-        token = api.AccessToken(livekit_api_key, livekit_api_secret) \
+        token = api.AccessToken(_LIVEKIT_API_KEY, _LIVEKIT_API_SECRET) \
             .with_identity(f"user-{request.session_id}") \
             .with_name("Movi User") \
             .with_grants(api.VideoGrants(
@@ -305,13 +346,13 @@ async def get_voice_token(request: VoiceTokenRequest):
                 can_publish=True,
                 can_subscribe=True,
             )) \
-            .with_metadata(f'{{"context_page": "{request.context_page}", "session_id": "{request.session_id}"}}') \
+            .with_metadata(metadata) \
             .to_jwt()
         
         return VoiceTokenResponse(
             token=token,
             room_name=room_name,
-            url=livekit_url
+            url=_LIVEKIT_URL
         )
         
     except Exception as e:
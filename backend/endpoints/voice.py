@@ -4,51 +4,90 @@ Real-time voice conversation using OpenAI Whisper (STT) and TTS
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from typing import Dict, Optional
+from cachetools import TTLCache
+import asyncio
 import json
-import sys
+import logging
 import os
 from datetime import datetime
-
-# Add paths
-sys.path.append(os.path.join(os.path.dirname(__file__), "..", "intelligence"))
-sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
-
-from intelligence.graph import app as movi_graph
-from langchain_core.messages import HumanMessage
+from intelligence.graph import app as movi_graph, extract_interrupt
 from langgraph.types import Command
 from utils.audio_processing import (
     transcribe_audio,
-    text_to_speech,
-    audio_base64_to_bytes,
-    audio_bytes_to_base64
+    stream_text_to_speech,
+    audio_base64_to_bytes
 )
+from utils.history import tail_messages
 
 router = APIRouter(prefix="/movi", tags=["voice"])
 
+logger = logging.getLogger(__name__)
+
+# Replies that approve a pending high-impact action
+_APPROVAL_TOKENS = frozenset({
+    "yes", "y", "proceed", "confirm", "ok", "okay", "yeah", "yep", "sure", "approve"
+})
+
+
+VOICE_SESSION_MAX = int(os.getenv("VOICE_SESSION_MAX", "10000"))
+VOICE_SESSION_TTL_SECONDS = int(os.getenv("VOICE_SESSION_TTL_SECONDS", "3600"))
+VOICE_HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("VOICE_HEARTBEAT_INTERVAL_SECONDS", "30"))
+
 
 class VoiceSessionManager:
-    """Manages active voice sessions"""
+    """
+    Manages active voice sessions.
+    Sessions live in a bounded TTL cache so crashed connections cannot leak;
+    a heartbeat task pings each websocket, refreshing live sessions and dropping dead ones.
+    """
     def __init__(self):
-        self.active_sessions: Dict[str, dict] = {}
+        self.active_sessions: TTLCache = TTLCache(maxsize=VOICE_SESSION_MAX, ttl=VOICE_SESSION_TTL_SECONDS)
+        self._heartbeat_task: Optional[asyncio.Task] = None
     
-    def create_session(self, session_id: str, websocket: WebSocket, context_page: str = "unknown"):
+    def create_session(self, session_id: str, websocket: WebSocket, send_lock: asyncio.Lock, context_page: str = "unknown"):
         self.active_sessions[session_id] = {
             "websocket": websocket,
+            "send_lock": send_lock,  # Held by the connection while it streams a reply
             "context_page": context_page,
             "created_at": datetime.now(),
             "conversation_active": True
         }
+        
+        # Started lazily: needs the running event loop
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
     
     def get_session(self, session_id: str) -> Optional[dict]:
         return self.active_sessions.get(session_id)
     
     def remove_session(self, session_id: str):
-        if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+        self.active_sessions.pop(session_id, None)
     
     def update_context(self, session_id: str, context_page: str):
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]["context_page"] = context_page
+        session = self.active_sessions.get(session_id)
+        if session is not None:
+            session["context_page"] = context_page
+    
+    async def _heartbeat_loop(self):
+        """Ping every session's websocket; drop sessions whose socket is gone."""
+        while self.active_sessions:
+            await asyncio.sleep(VOICE_HEARTBEAT_INTERVAL_SECONDS)
+            
+            for session_id, session in list(self.active_sessions.items()):
+                send_lock = session["send_lock"]
+                # A locked socket is streaming a reply: it is alive, and a ping
+                # must not land between its TTS chunks and audio_end
+                if not send_lock.locked():
+                    try:
+                        async with send_lock:
+                            await session["websocket"].send_json({"type": "ping"})
+                    except Exception:
+                        self.remove_session(session_id)
+                        continue
+                
+                # Re-inserting resets the TTL, so only idle-dead sessions expire
+                if session_id in self.active_sessions:
+                    self.active_sessions[session_id] = session
 
 
 voice_sessions = VoiceSessionManager()
@@ -62,13 +101,19 @@ async def voice_websocket(websocket: WebSocket):
     Protocol:
     1. Client sends: {"type": "init", "session_id": "...", "context_page": "..."}
     2. Server responds: {"type": "ready"}
-    3. Client sends: {"type": "audio", "data": "base64_audio", "format": "webm"}
+    3. Client sends: a binary frame of webm audio
+       (or, legacy: {"type": "audio", "data": "base64_audio", "format": "webm"})
     4. Server processes and responds: {"type": "transcription", "text": "..."}
-    5. Server responds: {"type": "audio_response", "data": "base64_audio", "text": "..."}
-    6. Client sends: {"type": "close"}
+    5. Server responds: {"type": "response", "text": "...", "awaiting_confirmation": ..., ...}
+    6. Server streams: binary MP3 chunk frames ... then {"type": "audio_end"}
+    7. Client sends: {"type": "close"}
     """
     await websocket.accept()
     session_id = None
+    # Last page reported by this client; survives eviction of its cached session
+    context_page = "unknown"
+    # Serializes this socket's sends: a reply holds it, heartbeat pings take it or skip
+    send_lock = asyncio.Lock()
     
     try:
         # Ensure the Movi agent is available before processing messages
@@ -78,8 +123,16 @@ async def voice_websocket(websocket: WebSocket):
             return
 
         while True:
-            # Receive message from client
-            message = await websocket.receive_json()
+            # Receive message from client: JSON text frames, or binary frames carrying raw audio
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            
+            audio_bytes = frame.get("bytes")
+            if audio_bytes is not None:
+                message = {"type": "audio", "format": "webm"}
+            else:
+                message = json.loads(frame["text"])
             msg_type = message.get("type")
             
             # Handle initialization
@@ -94,7 +147,7 @@ async def voice_websocket(websocket: WebSocket):
                     })
                     continue
                 
-                voice_sessions.create_session(session_id, websocket, context_page)
+                voice_sessions.create_session(session_id, websocket, send_lock, context_page)
                 
                 await websocket.send_json({
                     "type": "ready",
@@ -113,156 +166,148 @@ async def voice_websocket(websocket: WebSocket):
                 audio_base64 = message.get("data")
                 audio_format = message.get("format", "webm")
                 
-                if not audio_base64:
+                if not audio_bytes and not audio_base64:
                     await websocket.send_json({
                         "type": "error",
                         "message": "No audio data provided"
                     })
                     continue
                 
-                try:
-                    # Step 1: Convert audio to text (STT)
-                    audio_bytes = audio_base64_to_bytes(audio_base64)
-                    transcribed_text = transcribe_audio(audio_bytes, audio_format)
+                # Hold the send lock for the whole turn (transcription ... audio_end)
+                async with send_lock:
+                    try:
+                        # Step 1: Convert audio to text (STT); base64 JSON frames are still accepted
+                        if audio_bytes is None:
+                            audio_bytes = audio_base64_to_bytes(audio_base64)
+                        transcribed_text = await transcribe_audio(audio_bytes, audio_format)
                     
-                    # Send transcription to client
-                    await websocket.send_json({
-                        "type": "transcription",
-                        "text": transcribed_text
-                    })
+                        # Send transcription to client
+                        await websocket.send_json({
+                            "type": "transcription",
+                            "text": transcribed_text
+                        })
                     
-                    # Step 2: Process with LangGraph (same as text chat)
-                    session = voice_sessions.get_session(session_id)
-                    context_page = session["context_page"]
+                        # Step 2: Process with LangGraph (same as text chat)
+                        session = voice_sessions.get_session(session_id)
+                        if session is None:
+                            # Evicted from the session cache: re-register this socket on its last page
+                            voice_sessions.create_session(session_id, websocket, send_lock, context_page)
+                            session = voice_sessions.get_session(session_id)
+                        context_page = session["context_page"]
                     
-                    # Build LangGraph config
-                    config = {
-                        "configurable": {
-                            "thread_id": session_id
+                        # Build LangGraph config
+                        config = {
+                            "configurable": {
+                                "thread_id": session_id
+                            }
                         }
-                    }
                     
-                    # Check if conversation state exists and if interrupted
-                    current_state = movi_graph.get_state(config)
+                        # Check if conversation state exists and if interrupted
+                        current_state = await movi_graph.aget_state(config)
                     
-                    # Send processing status
-                    await websocket.send_json({
-                        "type": "processing",
-                        "status": "thinking"
-                    })
+                        # Send processing status
+                        await websocket.send_json({
+                            "type": "processing",
+                            "status": "thinking"
+                        })
                     
-                    response_text = ""
-                    requires_confirmation = False
-                    awaiting_confirmation = False
-                    consequence_info = None
+                        response_text = ""
+                        requires_confirmation = False
+                        awaiting_confirmation = False
+                        consequence_info = None
                     
-                    # If graph is interrupted, handle resume
-                    if current_state.next:
-                        # User is responding to previous interrupt
-                        user_approved = transcribed_text.lower().strip() in [
-                            "yes", "y", "proceed", "confirm", "ok", "okay", "sure"
-                        ]
-                        result = movi_graph.invoke(Command(resume=user_approved), config=config)
+                        # If graph is interrupted, handle resume
+                        if current_state.next:
+                            # User is responding to previous interrupt
+                            # (Whisper punctuates transcripts, e.g. "Yes.")
+                            user_approved = transcribed_text.strip().strip(".!?,").lower() in _APPROVAL_TOKENS
+                            result = await movi_graph.ainvoke(Command(resume=user_approved), config=config)
                         
-                        # Extract response from result
-                        last_message = result.get("messages", [])[-1] if result.get("messages") else None
-                        if last_message:
-                            response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
-                        else:
-                            response_text = result.get("response", "No response generated.")
+                            # Extract response from result
+                            last_message = result.get("messages", [])[-1] if result.get("messages") else None
+                            if last_message:
+                                response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
+                            else:
+                                response_text = result.get("response", "No response generated.")
                         
-                        requires_confirmation = result.get("requires_confirmation", False)
-                        awaiting_confirmation = result.get("awaiting_confirmation", False)
-                        consequence_info = result.get("consequence_info")
-                    else:
-                        # Normal flow: Create proper MoviState
-                        # Load existing chat history from checkpointer (if any)
-                        existing_messages = current_state.values.get("messages", []) if current_state.values else []
+                            requires_confirmation = result.get("requires_confirmation", False)
+                            awaiting_confirmation = result.get("awaiting_confirmation", False)
+                            consequence_info = result.get("consequence_info")
+                        else:
+                            # Normal flow: Create proper MoviState
+                            # Load existing chat history from checkpointer (if any)
+                            existing_messages = current_state.values.get("messages", []) if current_state.values else []
                         
-                        # Trim to last 5 conversation pairs (10 messages)
-                        if len(existing_messages) > 10:
-                            existing_messages = existing_messages[-10:]
+                            # Keep only the most recent messages (see HISTORY_TAIL_MESSAGES)
+                            existing_messages = tail_messages(existing_messages)
                         
-                        input_state = {
-                            "user_msg": transcribed_text,
-                            "current_page": context_page,
-                            "messages": existing_messages,  # Load previous history
-                            "intent": None,
-                            "tool_name": None,
-                            "entities": None,
-                            "needs_user_input": False,
-                            "consequences": None,
-                            "awaiting_confirmation": False,
-                            "tool_result": None
-                        }
+                            input_state = {
+                                "user_msg": transcribed_text,
+                                "current_page": context_page,
+                                "messages": existing_messages,  # Load previous history
+                                "image_base64": None,
+                                "image_content": None,
+                                "intent": None,
+                                "tool_name": None,
+                                "entities": None,
+                                "needs_user_input": False,
+                                "consequences": None,
+                                "awaiting_confirmation": False,
+                                "tool_result": None,
+                                "response": None
+                            }
                     
-                        # Invoke the graph
-                        result = movi_graph.invoke(input_state, config=config)
+                            # Invoke the graph (async: the request analyzer node is a coroutine)
+                            result = await movi_graph.ainvoke(input_state, config=config)
                     
-                        # Check final state for interrupts
-                        final_state = movi_graph.get_state(config)
-                        is_interrupted = bool(final_state.next)
+                            # The result carries any pending interrupt; no checkpoint reload needed
+                            interrupt_data = extract_interrupt(result)
                         
-                        # Extract response
-                        if is_interrupted:
-                            interrupt_data = final_state.tasks[0].interrupts[0].value if final_state.tasks and final_state.tasks[0].interrupts else {}
-                            response_text = interrupt_data.get("details", "Confirmation required.")
-                            response_text += "\n\nDo you want to proceed? (yes/no)"
-                            awaiting_confirmation = True
-                        else:
-                            # Normal response
-                            last_message = result.get("messages", [])[-1] if result.get("messages") else None
-                            if last_message:
-                                response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
+                            # Extract response
+                            if interrupt_data is not None:
+                                response_text = interrupt_data.get("details", "Confirmation required.")
+                                response_text += "\n\nDo you want to proceed? (yes/no)"
+                                awaiting_confirmation = True
                             else:
-                                response_text = result.get("response", "No response generated.")
+                                # Normal response
+                                last_message = result.get("messages", [])[-1] if result.get("messages") else None
+                                if last_message:
+                                    response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
+                                else:
+                                    response_text = result.get("response", "No response generated.")
                         
-                        requires_confirmation = result.get("requires_confirmation", False)
-                        awaiting_confirmation = result.get("awaiting_confirmation", False)
-                        consequence_info = result.get("consequence_info")
+                            requires_confirmation = result.get("requires_confirmation", False)
+                            awaiting_confirmation = result.get("awaiting_confirmation", False)
+                            consequence_info = result.get("consequence_info")
                     
-                    # Send text response IMMEDIATELY (before TTS generation)
-                    await websocket.send_json({
-                        "type": "text_response",
-                        "text": response_text,
-                        "requires_confirmation": requires_confirmation,
-                        "awaiting_confirmation": awaiting_confirmation,
-                        "consequence_info": consequence_info
-                    })
-                    
-                    # Step 3: Convert response to speech (TTS) - AFTER text is shown
-                    await websocket.send_json({
-                        "type": "processing",
-                        "status": "generating_audio"
-                    })
+                        # Send the reply text right away so the client renders it while audio streams
+                        await websocket.send_json({
+                            "type": "response",
+                            "text": response_text,
+                            "requires_confirmation": requires_confirmation,
+                            "awaiting_confirmation": awaiting_confirmation,
+                            "consequence_info": consequence_info
+                        })
                     
-                    audio_response = text_to_speech(response_text, voice="nova")  # Female voice
-                    audio_base64_response = audio_bytes_to_base64(audio_response)
+                        # Step 3: Stream speech (TTS) chunks as OpenAI synthesizes them, as binary frames
+                        async for chunk in stream_text_to_speech(response_text, voice="nova"):  # Female voice
+                            await websocket.send_bytes(chunk)
                     
-                    # Send audio response to client
-                    await websocket.send_json({
-                        "type": "audio_response",
-                        "data": audio_base64_response,
-                        "text": response_text,
-                        "requires_confirmation": requires_confirmation,
-                        "awaiting_confirmation": awaiting_confirmation,
-                        "consequence_info": consequence_info
-                    })
+                        await websocket.send_json({"type": "audio_end"})
                     
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
+                    except Exception as e:
+                        logger.exception("Voice turn failed")
                     
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": f"Failed to process voice: {str(e)}"
-                    })
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": f"Failed to process voice: {str(e)}"
+                        })
             
             # Handle context update
             elif msg_type == "update_context":
                 if session_id:
-                    new_context = message.get("context_page", "unknown")
-                    voice_sessions.update_context(session_id, new_context)
+                    context_page = message.get("context_page", "unknown")
+                    voice_sessions.update_context(session_id, context_page)
             
             # Handle close
             elif msg_type == "close":
@@ -276,9 +321,8 @@ async def voice_websocket(websocket: WebSocket):
     
     except WebSocketDisconnect:
         pass
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Voice websocket error")
     finally:
         if session_id:
             voice_sessions.remove_session(session_id)
@@ -296,6 +340,6 @@ async def get_voice_sessions():
                 "context_page": session["context_page"],
                 "created_at": session["created_at"].isoformat()
             }
-            for sid, session in voice_sessions.active_sessions.items()
+            for sid, session in list(voice_sessions.active_sessions.items())
         ]
     }
@@ -0,0 +1,135 @@
+"""
+Durable LangGraph checkpointer for Movi
+SQLite-backed saver shared across workers, with TTL eviction of idle sessions
+"""
+import asyncio
+import logging
+import os
+import time
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_HOURS", "2")) * 3600
+CHECKPOINT_CLEANUP_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_CLEANUP_INTERVAL_SECONDS", "600"))
+
+
+# Helper function: Keep raw image payloads out of persisted checkpoints
+def _strip_image_payload(checkpoint):
+    """Return the checkpoint with image_base64 cleared (the analyzer only needs it in memory)."""
+    values = checkpoint.get("channel_values") or {}
+    start_input = values.get("__start__")
+    has_start_image = isinstance(start_input, dict) and start_input.get("image_base64")
+
+    if not values.get("image_base64") and not has_start_image:
+        return checkpoint
+
+    values = dict(values)
+    if values.get("image_base64"):
+        values["image_base64"] = None
+    if has_start_image:
+        values["__start__"] = {**start_input, "image_base64": None}
+    return {**checkpoint, "channel_values": values}
+
+
+# Helper function: Same for pending channel writes (the __start__ task writes the raw input)
+def _strip_image_writes(writes):
+    """Return the writes with any image_base64 value cleared."""
+    stripped = []
+    for channel, value in writes:
+        if channel == "image_base64" and value:
+            value = None
+        elif channel == "__start__" and isinstance(value, dict) and value.get("image_base64"):
+            value = {**value, "image_base64": None}
+        stripped.append((channel, value))
+    return stripped
+
+
+class TTLAsyncSqliteSaver(AsyncSqliteSaver):
+    """
+    AsyncSqliteSaver that records the last write time per thread so that
+    sessions idle for longer than the TTL can be evicted.
+    """
+
+    _activity_ready = False
+
+    async def setup(self):
+        await super().setup()
+        if self._activity_ready:
+            return
+        async with self.lock:
+            await self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity ("
+                "thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+            )
+            await self.conn.commit()
+        self._activity_ready = True
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        # Queue the activity upsert uncommitted: the commit in super().aput covers it,
+        # so the checkpoint and its activity timestamp land in one transaction
+        # (if that write fails, the upsert rides along with the connection's next commit)
+        thread_id = str(config["configurable"]["thread_id"])
+        async with self.lock:
+            await self.conn.execute(
+                "INSERT INTO thread_activity (thread_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (thread_id, time.time()),
+            )
+        return await super().aput(config, _strip_image_payload(checkpoint), metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await super().aput_writes(config, _strip_image_writes(writes), task_id, task_path)
+
+    async def aevict_expired(self, ttl_seconds=CHECKPOINT_TTL_SECONDS):
+        """Delete all checkpoints of threads not written to within ttl_seconds."""
+        await self.setup()
+        cutoff = time.time() - ttl_seconds
+
+        async with self.lock:
+            async with self.conn.execute(
+                "SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,)
+            ) as cursor:
+                expired = [row[0] for row in await cursor.fetchall()]
+
+        evicted = 0
+        for thread_id in expired:
+            async with self.lock:
+                # Re-check the timestamp: the thread may have been written since the SELECT
+                cursor = await self.conn.execute(
+                    "DELETE FROM thread_activity WHERE thread_id = ? AND updated_at < ?",
+                    (thread_id, cutoff),
+                )
+                if cursor.rowcount:
+                    # Same tables adelete_thread clears, but in this transaction
+                    await self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                    await self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                    evicted += 1
+                await self.conn.commit()
+
+        return evicted
+
+
+async def create_checkpointer():
+    """Open the SQLite checkpoint store (must run inside the event loop)."""
+    conn = await aiosqlite.connect(CHECKPOINT_DB_PATH)
+    saver = TTLAsyncSqliteSaver(conn)
+    await saver.setup()
+    return saver
+
+
+async def checkpoint_cleanup_loop(saver):
+    """Background task: periodically evict idle sessions from the checkpointer."""
+    while True:
+        await asyncio.sleep(CHECKPOINT_CLEANUP_INTERVAL_SECONDS)
+        try:
+            await saver.aevict_expired()
+        except Exception:
+            # Cleanup is best effort; try again next interval
+            logger.exception("Checkpoint eviction failed")
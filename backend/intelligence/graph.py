@@ -1,9 +1,17 @@
 from langchain_openai import ChatOpenAI
-from intelligence.nodes import request_analyzer_node, reply_generator_node, safety_validator_node, action_executor_node
+from intelligence.nodes import (
+    request_analyzer_node,
+    reply_generator_node,
+    consequence_checker_node,
+    safety_validator_node,
+    action_executor_node,
+    requires_confirmation,
+)
 from intelligence.tools import ALL_TOOLS
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
-from intelligence.state import FleetAgentState
+from intelligence.state import FleetAgentState, AnalyzerOutput
+from intelligence.checkpointer import create_checkpointer
 from dotenv import load_dotenv
 import os
 
@@ -49,25 +57,49 @@ def create_fleet_agent_graph(llm, ALL_TOOLS):
     
     The graph now uses interrupt() in the safety_validator_node to pause execution
     and wait for human approval. No separate confirmation nodes needed.
+
+    High-impact tools are routed through consequence_checker first so the
+    database lookup is checkpointed before the interrupt; on resume only the
+    safety validator re-runs, never the analyzer LLM or the lookup.
     """
 
-    graph = StateGraph(dict)
+    # Typed schema: one channel per key, so nodes' updates are applied per field
+    # (every key a node writes must be declared in FleetAgentState)
+    graph = StateGraph(FleetAgentState)
+
+    # Analyzer uses OpenAI JSON mode parsed straight into AnalyzerOutput
+    analyzer_llm = llm.with_structured_output(AnalyzerOutput, method="json_mode")
+
+    # Async wrappers so LangGraph schedules the LLM calls on the event loop
+    async def request_analyzer(state):
+        return await request_analyzer_node(state, analyzer_llm, ALL_TOOLS)
+
+    async def reply_generator(state, config):
+        return await reply_generator_node(state, llm, config)
 
     # 1. Add nodes
-    graph.add_node("request_analyzer", lambda s: request_analyzer_node(s, llm, ALL_TOOLS))
+    graph.add_node("request_analyzer", request_analyzer)
+    graph.add_node("consequence_checker", consequence_checker_node)
     graph.add_node("safety_validator", safety_validator_node)
-    graph.add_node("action_executor", lambda s: action_executor_node(s, ALL_TOOLS))
-    graph.add_node("reply_generator", lambda s: reply_generator_node(s, llm))
+    graph.add_node("action_executor", action_executor_node)
+    graph.add_node("reply_generator", reply_generator)
 
     # 2. Entry → Request Analyzer
     graph.set_entry_point("request_analyzer")
 
-    # 3. Request Analyzer → Safety Validator (check for high-impact tools)
-    graph.add_edge("request_analyzer", "safety_validator")
+    # 3. Request Analyzer → Consequence Checker (high-impact tools) or Action Executor
+    graph.add_conditional_edges(
+        "request_analyzer",
+        lambda s: "consequence_checker" if requires_confirmation(s) else "action_executor",
+        ["consequence_checker", "action_executor"],
+    )
+
+    # Consequence Checker → Safety Validator
+    graph.add_edge("consequence_checker", "safety_validator")
 
     # 4. Safety Validator → Action Executor
     # Note: If safety_validator_node calls interrupt(), execution pauses here
-    # The interrupt() returns when user calls graph.invoke(Command(resume=...))
+    # The interrupt() returns when user calls graph.ainvoke(Command(resume=...))
     graph.add_edge("safety_validator", "action_executor")
 
     # 5. Action Executor → Reply Generator
@@ -77,10 +109,35 @@ def create_fleet_agent_graph(llm, ALL_TOOLS):
     graph.set_finish_point("reply_generator")
 
     # 7. Compile with checkpointer for interrupt support
-    # MemorySaver is for development - use a durable checkpointer in production
+    # MemorySaver is the in-process fallback; the API swaps in the durable
+    # SQLite checkpointer on startup (see attach_durable_checkpointer)
     checkpointer = MemorySaver()
     return graph.compile(checkpointer=checkpointer)
 
 # Initialize LLM and build the graph
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-app = create_fleet_agent_graph(llm, ALL_TOOLS)
\ No newline at end of file
+app = create_fleet_agent_graph(llm, ALL_TOOLS)
+
+
+async def attach_durable_checkpointer():
+    """
+    Replace the in-memory checkpointer with the SQLite-backed one.
+
+    Must be awaited inside the running event loop (the async saver binds to it),
+    so it is called from the API lifespan handler rather than at import time.
+    """
+    app.checkpointer = await create_checkpointer()
+    return app.checkpointer
+
+def extract_interrupt(state):
+    """
+    Return the pending HITL interrupt payload, or None if the turn completed.
+
+    Accepts either an ainvoke/astream result dict (interrupts under "__interrupt__")
+    or a StateSnapshot from aget_state, so callers need not reload the checkpoint.
+    """
+    if isinstance(state, dict):
+        interrupts = state.get("__interrupt__") or ()
+    else:
+        interrupts = [i for task in (state.tasks or ()) for i in (task.interrupts or ())]
+    return interrupts[0].value if interrupts else None
@@ -1,47 +1,96 @@
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.exceptions import OutputParserException
 from langchain_openai import ChatOpenAI
-from langgraph.types import interrupt, Command
-import json
+from langgraph.types import interrupt
+from collections import OrderedDict
+import asyncio
+import base64
+import hashlib
+import io
+import orjson
+from PIL import Image
 from intelligence.tools import ALL_TOOLS, get_tools_for_page
-from database import SessionLocal
-from database import get_db
-from intelligence.state import FleetAgentState
 
-def request_analyzer_node(state, llm, ALL_TOOLS):
-    """
-    First Node: Request Analysis and Intent Classification
+# Vision-capable LLM (gpt-4o for better OCR), shared so its HTTP connection pool is reused
+VISION_LLM = ChatOpenAI(model="gpt-4o", temperature=0)
 
-    Inputs in state:
-        - user_msg
-        - current_page
-        - messages (history)
+# Tool registry for O(1) lookup, built once at import time
+TOOL_REGISTRY = {tool.name: tool for tool in ALL_TOOLS}
 
-    Outputs added to state:
-        - intent
-        - tool_name
-        - entities
-        - messages (updated)
-    """
+# Per-page caches for analyzer prompt construction (tool lists are static per page).
+# current_page comes from the client, so cap the number of cached pages.
+_PROMPT_CACHE_MAX_PAGES = 64
+_TOOL_DESC_CACHE: dict[str, str] = {}
+_ANALYZER_PROMPT_CACHE: dict[tuple[str, bool], str] = {}
 
-    user_msg = state["user_msg"]
-    current_page = state["current_page"]
-    image_base64 = state.get("image_base64")  # Optional image input
 
-    # Initialize history if missing
-    messages = state.get("messages", [])
-    if messages is None:
-        messages = []
-    
-    # ---- Image Analysis (if provided) ----
-    if image_base64:
-        # Use GPT-4o (full model) for better vision and OCR capabilities
-        vision_llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        
-        vision_message = HumanMessage(
-            content=[
-                {
-                    "type": "text", 
-                    "text": """Analyze this image carefully and extract ALL text and information visible.
+# LRU cache of vision descriptions keyed by image content hash (temperature=0, so deterministic)
+_IMAGE_DESC_CACHE_MAX = 256
+IMAGE_DESC_CACHE: "OrderedDict[str, str]" = OrderedDict()
+
+
+# Helper function: Ephemeral image context for the current turn's LLM calls
+def _image_context_messages(image_description):
+    """Return a one-off system message with the image description (not persisted to history)."""
+    if not image_description:
+        return []
+    return [SystemMessage(content=f"Image context: {image_description}")]
+
+
+# Helper function: Look up an LRU cache entry and mark it as recently used
+def _lru_get(cache, key):
+    """Return the cached value for key, or None on miss."""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+# Helper function: Store an LRU cache entry, evicting the least recently used one
+def _lru_put(cache, key, value, max_size):
+    """Insert value under key and trim the cache to max_size entries."""
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+
+
+# Helper function: Hash image content so identical screenshots share one description
+def _image_cache_key(image_base64):
+    """SHA-256 of the decoded image bytes (falls back to the raw string if undecodable)."""
+    try:
+        image_bytes = base64.b64decode(image_base64)
+    except Exception:
+        image_bytes = image_base64.encode()
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+# Longest image side and JPEG quality sent to the vision LLM (vision tokens scale with resolution)
+VISION_MAX_IMAGE_SIDE = 1024
+VISION_JPEG_QUALITY = 85
+
+
+# Helper function: Downscale and re-encode an image before sending it to the vision LLM
+def _downscale_image(image_base64):
+    """Return base64 JPEG no larger than VISION_MAX_IMAGE_SIDE; the original on failure."""
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+        if image.format == "JPEG" and max(image.size) <= VISION_MAX_IMAGE_SIDE:
+            return image_base64
+
+        image.thumbnail((VISION_MAX_IMAGE_SIDE, VISION_MAX_IMAGE_SIDE))
+        if image.mode != "RGB":
+            image = image.convert("RGB")  # JPEG has no alpha/palette modes
+
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=VISION_JPEG_QUALITY)
+        return base64.b64encode(buffer.getvalue()).decode()
+    except Exception:
+        return image_base64
+
+
+# Instructions sent alongside the image to the vision LLM
+_VISION_PROMPT = """Analyze this image carefully and extract ALL text and information visible.
 
 Pay special attention to:
 1. ANY highlighted, circled, or marked items (these are MOST IMPORTANT)
@@ -52,51 +101,73 @@ Pay special attention to:
 6. Any arrows or visual emphasis
 
 Provide a detailed description focusing on what the user wants to highlight or draw attention to. If there are circles, arrows, or highlighting, mention those items FIRST and PROMINENTLY."""
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                }
-            ]
-        )
-        
-        # Call vision-capable LLM (gpt-4o for better OCR)
-        vision_response = vision_llm.invoke([vision_message])
-        image_description = vision_response.content
-        
-        # Store the text description and clear the base64 (save memory)
-        state["image_content"] = image_description
-        state["image_base64"] = None  # Clear base64 after processing
-        
-        # Append image analysis to user message
-        user_msg = f"{user_msg}\n\n[Image Analysis: {image_description}]"
-    else:
-        state["image_content"] = None
 
-    # 1. Add user message to chat history
-    messages.append(HumanMessage(content=user_msg))
 
-    # 2. Prepare tool descriptions
-    # Filter tools based on current page context
-    available_tools = get_tools_for_page(current_page)
-    
-    tool_descriptions = "\n".join([
-        f"- {tool.name}: {tool.description}"
-        for tool in available_tools
-    ])
+# Helper function: Describe an image with the vision LLM, cached by content hash
+async def _describe_image(image_base64):
+    """Return the vision description of the image, skipping the LLM call on cache hit."""
+    cache_key = _image_cache_key(image_base64)
+    image_description = _lru_get(IMAGE_DESC_CACHE, cache_key)
+    if image_description is not None:
+        return image_description
+
+    # Resize off the event loop; decoding/encoding is CPU-bound
+    image_base64 = await asyncio.to_thread(_downscale_image, image_base64)
 
-    # 3. System prompt for LLM - conditionally include image instructions
-    if image_base64 or state.get("image_content"):
+    vision_message = HumanMessage(
+        content=[
+            {"type": "text", "text": _VISION_PROMPT},
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+            }
+        ]
+    )
+
+    # Call vision-capable LLM (gpt-4o for better OCR) without blocking the event loop
+    vision_response = await VISION_LLM.ainvoke([vision_message])
+    image_description = vision_response.content
+    _lru_put(IMAGE_DESC_CACHE, cache_key, image_description, _IMAGE_DESC_CACHE_MAX)
+    return image_description
+
+
+# Helper function: Format tool descriptions for a page, memoized per page
+def _get_tool_descriptions(current_page):
+    """Return the formatted tool list for the page, building it only once per page."""
+    tool_descriptions = _TOOL_DESC_CACHE.get(current_page)
+    if tool_descriptions is None:
+        # Filter tools based on current page context
+        tool_descriptions = "\n".join([
+            f"- {tool.name}: {tool.description}"
+            for tool in get_tools_for_page(current_page)
+        ])
+        if len(_TOOL_DESC_CACHE) < _PROMPT_CACHE_MAX_PAGES:
+            _TOOL_DESC_CACHE[current_page] = tool_descriptions
+    return tool_descriptions
+
+
+# Helper function: Build the analyzer system prompt, memoized per (page, has_image)
+def _get_analyzer_prompt(current_page, has_image):
+    """Return the analyzer system prompt; only the page and image presence vary."""
+    cache_key = (current_page, has_image)
+    system_prompt = _ANALYZER_PROMPT_CACHE.get(cache_key)
+    if system_prompt is not None:
+        return system_prompt
+
+    tool_descriptions = _get_tool_descriptions(current_page)
+
+    if has_image:
         # Include image-specific instructions only when image is present
         system_prompt = f"""
 You are Movi's request analyzer.
 
 You receive:
-- user_msg: the user's query (includes image analysis)
+- user_msg: the user's query
+- image context: a description of an image the user attached
 - current_page: UI context
 - available tools
 
-IMPORTANT: The user message includes [Image Analysis: ...]. Pay VERY CLOSE ATTENTION to:
+IMPORTANT: The "Image context" message describes the user's image. Pay VERY CLOSE ATTENTION to:
 - Items that are highlighted, circled, or marked with arrows
 - Trip names that are emphasized or visually called out
 - These highlighted items are what the user wants to work with
@@ -148,20 +219,71 @@ Available Tools:
 {tool_descriptions}
 """
 
+    if len(_ANALYZER_PROMPT_CACHE) < 2 * _PROMPT_CACHE_MAX_PAGES:
+        _ANALYZER_PROMPT_CACHE[cache_key] = system_prompt
+    return system_prompt
+
+
+async def request_analyzer_node(state, llm, ALL_TOOLS):
+    """
+    First Node: Request Analysis and Intent Classification
+
+    Inputs in state:
+        - user_msg
+        - current_page
+        - messages (history)
+
+    Outputs added to state:
+        - intent
+        - tool_name
+        - entities
+        - messages (updated)
+    """
+
+    user_msg = state["user_msg"]
+    current_page = state["current_page"]
+    image_base64 = state.get("image_base64")  # Optional image input
+
+    # Initialize history if missing
+    messages = state.get("messages", [])
+    if messages is None:
+        messages = []
+    
+    # ---- Image Analysis (if provided) ----
+    if image_base64:
+        # Reuse the description when the same image was already analyzed
+        image_description = await _describe_image(image_base64)
+
+        # Store the text description and clear the base64 (save memory)
+        state["image_content"] = image_description
+        state["image_base64"] = None  # Clear base64 after processing
+    else:
+        image_description = None
+        state["image_content"] = None
+
+    # 1. Add user message to chat history (image analysis stays out of history,
+    #    so later turns don't re-send it to the LLM)
+    messages.append(HumanMessage(content=user_msg))
+
+    # 2-3. System prompt for LLM (tool descriptions + image instructions when present)
+    has_image = image_description is not None
+    system_prompt = _get_analyzer_prompt(current_page, has_image)
+
     # 4. LLM input
     llm_messages = [
         SystemMessage(content=system_prompt),
-        *messages
+        *_image_context_messages(image_description),
+        *messages  # already bounded by the endpoints (utils.history.tail_messages)
     ]
 
-    # 5. Call the LLM
-    llm_response = llm.invoke(llm_messages)
-
-    # 6. Parse safely
+    # 5-6. Call the LLM (async so concurrent requests share the event loop);
+    #      llm is bound to AnalyzerOutput in JSON mode, so the reply arrives parsed
     try:
-        parsed = json.loads(llm_response.content)
-    except Exception:
+        analysis = await llm.ainvoke(llm_messages)
+        parsed = analysis.model_dump()
+    except OutputParserException:
         parsed = {"intent": None, "tool_name": None, "entities": {}}
+    response_content = orjson.dumps(parsed).decode()
 
     # 7. Update state
     state["intent"] = parsed.get("intent")
@@ -169,18 +291,15 @@ Available Tools:
     state["entities"] = parsed.get("entities", {})
 
     # 8. Update chat history
-    messages.append(AIMessage(content=llm_response.content))
+    messages.append(AIMessage(content=response_content))
     state["messages"] = messages
 
     return state
 
 
 
-from sqlalchemy.orm import Session
-
 # import your DB session + models + check functions
-from database import SessionLocal
-from models import DailyTrip, Route
+from database import AsyncSessionLocal
 from intelligence.tools import (
     check_trip_consequences,
     check_route_deactivation_consequences,
@@ -198,7 +317,6 @@ HIGH_IMPACT_TOOLS = {
     "delete_path",
 }
 
-
 # Helper function: Extract entity value by multiple possible keys
 def _extract_entity_value(entities, possible_keys, default=None):
     """Extract entity value using multiple possible key names."""
@@ -220,7 +338,7 @@ def _get_consequence_checker(tool_name):
     return consequence_checkers.get(tool_name)
 
 # Helper function: Fetch consequences from database
-def _fetch_consequence_details(tool_name, entities, db):
+async def _fetch_consequence_details(tool_name, entities, db):
     """Fetch detailed consequences from database for high-impact actions."""
     # Map tool to entity extraction keys
     tool_entity_mapping = {
@@ -244,7 +362,9 @@ def _fetch_consequence_details(tool_name, entities, db):
     
     # Execute consequence check
     try:
-        result = checker_func(entity_value, db)
+        # Always read fresh data: the user is about to confirm a destructive action.
+        # Checkers use the sync ORM API; run_sync executes them on the async connection
+        result = await db.run_sync(lambda session: checker_func(entity_value, session))
         if result.get("has_consequences"):
             return {
                 "has_consequences": True,
@@ -268,43 +388,59 @@ def _handle_user_rejection(state):
     state["awaiting_confirmation"] = False
     return state
 
+def requires_confirmation(state):
+    """Return True when the analyzed tool is high-impact and needs user approval."""
+    return state.get("tool_name") in HIGH_IMPACT_TOOLS
+
+
+async def consequence_checker_node(state):
+    """
+    Consequence Checker Node - Looks up the impact of a high-impact action.
+
+    Runs as its own node so the result is checkpointed before the safety
+    validator interrupts; resuming the graph then re-enters only the
+    validator and does not repeat the database lookup.
+    """
+    tool_name = state.get("tool_name")
+    entities = state.get("entities", {})
+
+    # Fetch consequence details from database (pooled async session, non-blocking)
+    consequence_data = None
+
+    async with AsyncSessionLocal() as db:
+        try:
+            consequence_data = await _fetch_consequence_details(tool_name, entities, db)
+        except Exception:
+            # On error, still require confirmation but without details
+            consequence_data = None
+
+    # Store consequences in state
+    state["consequences"] = consequence_data
+    state["awaiting_confirmation"] = True
+    return state
+
+
 def safety_validator_node(state):
     """
-    Safety Validator Node - Validates high-impact actions and requires user confirmation.
+    Safety Validator Node - Requires user confirmation for high-impact actions.
     
     Process:
-    1. Initialize state flags
-    2. Check if tool requires validation
-    3. Fetch consequence details from database
-    4. Trigger interrupt for user confirmation
-    5. Handle user response (approve/reject)
+    1. Check if tool requires validation
+    2. Build interrupt payload from checkpointed consequences
+    3. Trigger interrupt for user confirmation
+    4. Handle user response (approve/reject)
     """
     
-    # Initialize state
-    state["consequences"] = None
-    state["awaiting_confirmation"] = False
-    
     tool_name = state.get("tool_name")
     entities = state.get("entities", {})
 
     # Skip validation for non-high-impact tools
     if tool_name not in HIGH_IMPACT_TOOLS:
+        state["consequences"] = None
+        state["awaiting_confirmation"] = False
         return state
 
-    # Fetch consequence details from database
-    db: Session = SessionLocal()
-    consequence_data = None
-    
-    try:
-        consequence_data = _fetch_consequence_details(tool_name, entities, db)
-    except Exception:
-        # On error, still require confirmation but without details
-        consequence_data = None
-    finally:
-        db.close()
-
-    # Store consequences in state
-    state["consequences"] = consequence_data
+    consequence_data = state.get("consequences")
     
     # Prepare interrupt payload
     interrupt_payload = consequence_data if consequence_data else {
@@ -325,10 +461,14 @@ def safety_validator_node(state):
     return state
 
 
-# Helper function: Create tool registry for faster lookup
-def _build_tool_registry(ALL_TOOLS):
-    """Build a dictionary mapping tool names to tool objects for O(1) lookup."""
-    return {tool.name: tool for tool in ALL_TOOLS}
+# Entity name aliases -> tool parameter names, in priority order per target
+_PARAM_MAP = {
+    "trip_name": "trip_display_name",
+    "trip": "trip_display_name",
+    "route_name": "route_display_name",
+    "route": "route_display_name",
+    "path": "path_name",
+}
 
 # Helper function: Normalize entity names to match tool parameter expectations
 def _normalize_entity_parameters(entities):
@@ -338,20 +478,10 @@ def _normalize_entity_parameters(entities):
     """
     normalized = entities.copy() if entities else {}
     
-    # Parameter name mapping rules
-    param_mappings = [
-        (["trip_name", "trip"], "trip_display_name"),
-        (["route_name", "route"], "route_display_name"),
-        (["path_name", "path"], "path_name"),
-    ]
-    
-    for source_names, target_name in param_mappings:
-        # Only map if target doesn't already exist
-        if target_name not in normalized:
-            for source_name in source_names:
-                if source_name in normalized:
-                    normalized[target_name] = normalized.pop(source_name)
-                    break
+    # Only map if target doesn't already exist; the first alias found wins
+    for source_name, target_name in _PARAM_MAP.items():
+        if source_name in normalized and target_name not in normalized:
+            normalized[target_name] = normalized.pop(source_name)
     
     return normalized
 
@@ -367,16 +497,15 @@ def _validate_tool_execution(tool_name, tool_registry):
     
     return tool, None
 
-def action_executor_node(state, ALL_TOOLS):
+def action_executor_node(state):
     """
     Action Executor Node - Executes tools with validation and error handling.
     
     Process:
-    1. Build tool registry for efficient lookup
-    2. Validate tool exists
-    3. Normalize entity parameters
-    4. Execute tool with error handling
-    5. Store result in state
+    1. Validate tool exists in the module-level registry
+    2. Normalize entity parameters
+    3. Execute tool with error handling
+    4. Store result in state
     """
     
     # Initialize result
@@ -388,11 +517,8 @@ def action_executor_node(state, ALL_TOOLS):
     if not tool_name:
         return state
 
-    # Build tool registry (could be cached, but keeping it simple for now)
-    tool_registry = _build_tool_registry(ALL_TOOLS)
-    
     # Validate tool exists
-    tool, validation_error = _validate_tool_execution(tool_name, tool_registry)
+    tool, validation_error = _validate_tool_execution(tool_name, TOOL_REGISTRY)
     if validation_error:
         state["tool_result"] = f"Validation Error: {validation_error}"
         return state
@@ -419,9 +545,7 @@ def action_executor_node(state, ALL_TOOLS):
 # The interrupt() pauses execution and waits for Command(resume=True/False)
 
 
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-
-def reply_generator_node(state, llm):
+async def reply_generator_node(state, llm, config=None):
     """
     Final Reply Generator Node
     Uses the LLM to generate the assistant's final reply to the user.
@@ -436,6 +560,9 @@ def reply_generator_node(state, llm):
     Output:
         - LLM reply appended to state.messages
         - state["response"] (string)
+
+    The reply is streamed; passing the node config through lets LangGraph's
+    "messages" stream mode forward tokens to the client as they arrive.
     """
 
     messages = state.get("messages", [])
@@ -459,20 +586,24 @@ Rules:
 - No JSON, only natural language.
     """
 
-    # 2. Build LLM messages
+    # 2. Build LLM messages (image context only on the turn the image arrived)
     llm_messages = [
         SystemMessage(content=system_prompt),
+        *_image_context_messages(state.get("image_content")),
         *messages
     ]
 
-    # 3. Invoke LLM
-    output = llm.invoke(llm_messages)
+    # 3. Stream LLM output, accumulating the full reply for checkpointing
+    reply_chunks = []
+    async for chunk in llm.astream(llm_messages, config=config):
+        reply_chunks.append(chunk.content)
+    reply = "".join(reply_chunks)
 
     # 4. Save final assistant message
-    assistant_msg = AIMessage(content=output.content)
+    assistant_msg = AIMessage(content=reply)
     messages.append(assistant_msg)
 
     state["messages"] = messages
-    state["response"] = output.content
+    state["response"] = reply
 
     return state
@@ -1,5 +1,6 @@
 from typing import TypedDict, List
 from langchain_core.messages import BaseMessage
+from pydantic import BaseModel, Field
 
 
 class FleetAgentState(TypedDict):
@@ -28,3 +29,11 @@ class FleetAgentState(TypedDict):
 
     # results
     tool_result: dict | None
+    response: str | None           # Final assistant reply from reply_generator
+
+
+class AnalyzerOutput(BaseModel):
+    """Structured output of the request analyzer LLM."""
+    intent: str | None = None
+    tool_name: str | None = None
+    entities: dict | None = Field(default_factory=dict)  # the model may answer null
@@ -5,12 +5,7 @@ Comprehensive tool collection with page-aware filtering
 from langchain.tools import tool
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
-import sys
-import os
-
-# Add backend to path to allow imports
-sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
-
+from datetime import datetime
 from models import Vehicle, DailyTrip, Deployment, Stop, Path, Route, Driver, RouteStatus, PathStop
 from database import SessionLocal
 from crud import (
@@ -226,7 +221,6 @@ def create_new_path(path_name: str, stop_names: List[str]) -> str:
             db.close()
             return f"Stop '{stop_name}' not found. Create it first."
         
-        from models import PathStop
         path_stop = PathStop(path_id=new_path.path_id, stop_id=stop.stop_id, stop_order=idx)
         db.add(path_stop)
     
@@ -355,7 +349,6 @@ def create_new_route(
             return f"Error: Path '{path_name}' not found."
         
         # Parse time
-        from datetime import datetime
         time_obj = datetime.strptime(shift_time, "%H:%M").time()
         
         route_status = RouteStatus.active if status == "active" else RouteStatus.deactivated
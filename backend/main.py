@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import OperationalError
 from models import Base
 from database import engine
 from endpoints.vehicle import router as vehicle_router
@@ -11,42 +12,95 @@ from endpoints.daily_trip import router as daily_trip_router
 from endpoints.deployment import router as deployment_router
 from endpoints.movi import router as movi_router
 from endpoints.voice import router as voice_router
+from intelligence.graph import attach_durable_checkpointer
+from intelligence.checkpointer import checkpoint_cleanup_loop
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, single-worker dev only
+    fcntl = None
+
 load_dotenv()
 
-# Create tables (only for SQLite, PostgreSQL should use migrations)
-if os.getenv("DATABASE_URL", "").startswith("sqlite"):
-    Base.metadata.create_all(bind=engine)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+# Lock file serializing schema creation across Uvicorn workers
+INIT_LOCK_PATH = os.getenv("INIT_LOCK_PATH", ".init.lock")
 
 # Get environment
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
+def create_sqlite_tables():
+    # Create tables (only for SQLite, PostgreSQL should use migrations).
+    # Workers start concurrently, so only one creates the schema at a time.
+    if not os.getenv("DATABASE_URL", "").startswith("sqlite"):
+        return
+
+    with open(INIT_LOCK_PATH, "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            Base.metadata.create_all(bind=engine)
+        except OperationalError:
+            # Another worker created the schema first
+            pass
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: schema (SQLite only), then durable, cross-worker chat state
+    # with periodic eviction of idle sessions
+    create_sqlite_tables()
+    saver = await attach_durable_checkpointer()
+    app.state.checkpointer = saver
+    app.state.checkpoint_cleanup = asyncio.create_task(checkpoint_cleanup_loop(saver))
+
+    yield
+
+    # Shutdown
+    app.state.checkpoint_cleanup.cancel()
+    await saver.conn.close()
+
+
 app = FastAPI(
     title="Move In Sync API",
     version="1.0.0",
     docs_url="/docs" if ENVIRONMENT != "production" else None,
     redoc_url="/redoc" if ENVIRONMENT != "production" else None,
+    lifespan=lifespan,
 )
 
-# Configure CORS based on environment
-if ENVIRONMENT == "production":
-    # Production: restrict to specific origins
-    allowed_origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
-    allowed_origins = [origin.strip() for origin in allowed_origins if origin.strip()]
-    if not allowed_origins:
+# Configure CORS based on environment.
+# Origins are always an explicit list: a wildcard is invalid together with credentials.
+allowed_origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
+allowed_origins = [origin.strip() for origin in allowed_origins if origin.strip()]
+if not allowed_origins:
+    if ENVIRONMENT == "production":
+        # Production: restrict to specific origins
         allowed_origins = ["http://localhost:80", "https://yourdomain.com"]
-else:
-    # Development: allow all origins
-    allowed_origins = ["*"]
+    else:
+        # Development: Vite dev server and local Docker frontend
+        allowed_origins = [
+            "http://localhost:8080",
+            "http://127.0.0.1:8080",
+            "http://localhost:5173",
+            "http://localhost",
+        ]
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
 app.include_router(vehicle_router)
@@ -5,10 +5,10 @@ from database import SessionLocal, engine
 from models import Base, Stop, Path, PathStop, Route, Vehicle, Driver, DailyTrip, Deployment, RouteStatus, VehicleType
 from datetime import time
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
-
 def seed_database():
+    # Create all tables (only when seeding, not on import)
+    Base.metadata.create_all(bind=engine)
+
     db = SessionLocal()
     
     try:
@@ -33,20 +33,16 @@ def seed_database():
             {"name": "Shopping Mall", "latitude": 12.9716, "longitude": 77.6098},
         ]
         
-        stops = []
-        for stop_data in stops_data:
-            stop = Stop(**stop_data)
-            db.add(stop)
-            stops.append(stop)
-        
-        db.commit()
+        # add_all + flush batches the INSERTs and still populates stop_ids for path stops
+        stops = [Stop(**stop_data) for stop_data in stops_data]
+        db.add_all(stops)
+        db.flush()
         print(f"✓ Created {len(stops)} stops")
         
         # Create Path
         path = Path(path_name="Main Route Path")
         db.add(path)
-        db.commit()
-        db.refresh(path)
+        db.flush()
         print(f"✓ Created path: {path.path_name}")
         
         # Create PathStops (ordered stops in the path)
@@ -57,15 +53,15 @@ def seed_database():
             {"stop": stops[3], "order": 4},  # Airport Terminal
         ]
         
-        for ps_data in path_stops_data:
-            path_stop = PathStop(
+        # Pure child rows: one bulk INSERT, no ORM identity tracking needed
+        db.bulk_save_objects([
+            PathStop(
                 path_id=path.path_id,
                 stop_id=ps_data["stop"].stop_id,
                 stop_order=ps_data["order"]
             )
-            db.add(path_stop)
-        
-        db.commit()
+            for ps_data in path_stops_data
+        ])
         print(f"✓ Created {len(path_stops_data)} path stops")
         
         # Create Route
@@ -81,8 +77,7 @@ def seed_database():
             allocated_waitlist=5
         )
         db.add(route)
-        db.commit()
-        db.refresh(route)
+        db.flush()
         print(f"✓ Created route: {route.route_display_name}")
         
         # Create Vehicles
@@ -94,13 +89,9 @@ def seed_database():
             {"license_plate": "KA-01-IJ-7890", "type": VehicleType.cab, "capacity": 4, "status": "active"},
         ]
         
-        vehicles = []
-        for vehicle_data in vehicles_data:
-            vehicle = Vehicle(**vehicle_data)
-            db.add(vehicle)
-            vehicles.append(vehicle)
-        
-        db.commit()
+        vehicles = [Vehicle(**vehicle_data) for vehicle_data in vehicles_data]
+        db.add_all(vehicles)
+        db.flush()
         print(f"✓ Created {len(vehicles)} vehicles")
         
         # Create Drivers
@@ -112,13 +103,9 @@ def seed_database():
             {"name": "Kavita Singh", "phone_number": "+91-9876543214"},
         ]
         
-        drivers = []
-        for driver_data in drivers_data:
-            driver = Driver(**driver_data)
-            db.add(driver)
-            drivers.append(driver)
-        
-        db.commit()
+        drivers = [Driver(**driver_data) for driver_data in drivers_data]
+        db.add_all(drivers)
+        db.flush()
         print(f"✓ Created {len(drivers)} drivers")
         
         # Create Daily Trips
@@ -129,13 +116,9 @@ def seed_database():
             {"route_id": route.route_id, "display_name": "Night Service", "booking_status_percentage": 30.0, "live_status": "scheduled"},
         ]
         
-        trips = []
-        for trip_data in trips_data:
-            trip = DailyTrip(**trip_data)
-            db.add(trip)
-            trips.append(trip)
-        
-        db.commit()
+        trips = [DailyTrip(**trip_data) for trip_data in trips_data]
+        db.add_all(trips)
+        db.flush()
         print(f"✓ Created {len(trips)} trips")
         
         # Create Deployments (assign vehicles and drivers to trips)
@@ -145,10 +128,9 @@ def seed_database():
             {"trip_id": trips[2].trip_id, "vehicle_id": vehicles[2].vehicle_id, "driver_id": drivers[2].driver_id},
         ]
         
-        for deployment_data in deployments_data:
-            deployment = Deployment(**deployment_data)
-            db.add(deployment)
+        db.bulk_save_objects([Deployment(**deployment_data) for deployment_data in deployments_data])
         
+        # Single transaction for the whole seed
         db.commit()
         print(f"✓ Created {len(deployments_data)} deployments")
         
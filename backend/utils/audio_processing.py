@@ -5,16 +5,19 @@ Handles STT (Speech-to-Text) and TTS (Text-to-Speech) using OpenAI APIs
 import os
 import base64
 import io
-from typing import Optional
-from openai import OpenAI
+from typing import AsyncIterator, Optional
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+TTS_STREAM_CHUNK_BYTES = 4096
 
-def transcribe_audio(audio_data: bytes, format: str = "webm") -> str:
+
+async def transcribe_audio(audio_data: bytes, format: str = "webm") -> str:
     """
     Convert audio bytes to text using OpenAI Whisper.
     
@@ -30,8 +33,8 @@ def transcribe_audio(audio_data: bytes, format: str = "webm") -> str:
         audio_file = io.BytesIO(audio_data)
         audio_file.name = f"audio.{format}"
         
-        # Call Whisper API
-        transcript = client.audio.transcriptions.create(
+        # Call Whisper API (async client: keeps the event loop free during the round-trip)
+        transcript = await async_client.audio.transcriptions.create(
             model="whisper-1",
             file=audio_file,
             language="en"  # Can be made dynamic
@@ -67,6 +70,31 @@ def text_to_speech(text: str, voice: str = "alloy") -> bytes:
         raise Exception(f"Text-to-speech failed: {str(e)}")
 
 
+async def stream_text_to_speech(text: str, voice: str = "alloy", chunk_size: int = TTS_STREAM_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """
+    Stream speech for text using OpenAI TTS, yielding audio as it is synthesized.
+    
+    Args:
+        text: Text to convert to speech
+        voice: Voice to use (alloy, echo, fable, onyx, nova, shimmer)
+        chunk_size: Size of each yielded chunk in bytes
+    
+    Yields:
+        Audio byte chunks (MP3 format)
+    """
+    try:
+        async with async_client.audio.speech.with_streaming_response.create(
+            model="tts-1",
+            voice=voice,
+            input=text,
+            response_format="mp3"
+        ) as response:
+            async for chunk in response.iter_bytes(chunk_size):
+                yield chunk
+    except Exception as e:
+        raise Exception(f"Text-to-speech failed: {str(e)}")
+
+
 def audio_base64_to_bytes(base64_audio: str) -> bytes:
     """
     Convert base64 encoded audio to bytes.
@@ -0,0 +1,27 @@
+"""
+Chat History Utilities
+Helpers for carrying checkpointed conversation history into a new turn
+"""
+from typing import List
+
+# Maximum number of stored messages carried into a new turn. This is the only history
+# bound: it caps both the checkpointed history and what the LLM nodes are sent.
+# Counted in messages, not turns (a turn can add more than a user/assistant pair).
+HISTORY_TAIL_MESSAGES = 10
+
+
+def tail_messages(messages: List, n: int = HISTORY_TAIL_MESSAGES) -> List:
+    """
+    Return the last n messages of a conversation.
+    
+    Args:
+        messages: Message history loaded from the checkpointer
+        n: Maximum number of messages to keep
+    
+    Returns:
+        The same list object when it is already short enough (no copy),
+        otherwise a slice of the last n messages
+    """
+    if len(messages) <= n:
+        return messages
+    return messages[-n:]
@@ -1,4 +1,5 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
+import { createStreamAudioPlayer } from '@/lib/streamAudioPlayer';
 
 const API_URL = import.meta.env.VITE_API_URL;
 
@@ -27,7 +28,14 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
   const audioChunksRef = useRef<Blob[]>([]);
   const audioContextRef = useRef<AudioContext | null>(null);
-  const currentAudioRef = useRef<HTMLAudioElement | null>(null);
+  
+  // TTS playback (streamed over the WebSocket, or a complete clip for confirmations)
+  const [audioPlayer] = useState(() => createStreamAudioPlayer({
+    onStart: () => setIsSpeaking(true),
+    onEnd: () => setIsSpeaking(false),
+    onError: (message) => onError?.(message)
+  }));
+  const stopAudio = audioPlayer.stop;
 
   // Initialize WebSocket connection
   const connectWebSocket = useCallback(() => {
@@ -38,6 +46,8 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
     
     const wsUrl = API_URL.replace('http', 'ws') + '/movi/voice';
     const ws = new WebSocket(wsUrl);
+    // TTS audio arrives as binary frames
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
       // Send initialization message
@@ -49,6 +59,11 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
     };
 
     ws.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        audioPlayer.appendChunk(new Uint8Array(event.data));
+        return;
+      }
+      
       const data = JSON.parse(event.data);
       
       if (data.type === 'ready') {
@@ -80,28 +95,17 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
           }
           return updated;
         });
-      } else if (data.type === 'text_response') {
-        // Final text response (before TTS)
-        setIsProcessing(true); // Still processing (generating audio)
+      } else if (data.type === 'response') {
+        setIsProcessing(false);
         
-        // Always create/update assistant message with the full response
+        // Reply text arrives before its audio; show it right away
         setMessages(prev => {
           const updated = [...prev];
-          // Find the last assistant message (if any)
-          let lastAssistantIndex = -1;
-          for (let i = updated.length - 1; i >= 0; i--) {
-            if (updated[i].type === 'assistant') {
-              lastAssistantIndex = i;
-              break;
-            }
-          }
-          
-          if (lastAssistantIndex >= 0) {
-            // Update existing assistant message
-            updated[lastAssistantIndex].text = data.text;
-            updated[lastAssistantIndex].timestamp = new Date();
+          const lastMessage = updated[updated.length - 1];
+          if (lastMessage && lastMessage.type === 'assistant') {
+            // Streamed text already shown for this turn
+            lastMessage.text = data.text || lastMessage.text;
           } else {
-            // Create new assistant message
             updated.push({
               type: 'assistant',
               text: data.text,
@@ -116,50 +120,13 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
           setRequiresConfirmation(true);
           setConsequenceInfo(data.consequence_info);
         }
-      } else if (data.type === 'audio_response') {
-        setIsProcessing(false);
-        
-        // Update assistant message with audio (text should already be shown)
-        setMessages(prev => {
-          const updated = [...prev];
-          // Find the last assistant message
-          let lastAssistantIndex = -1;
-          for (let i = updated.length - 1; i >= 0; i--) {
-            if (updated[i].type === 'assistant') {
-              lastAssistantIndex = i;
-              break;
-            }
-          }
-          
-          if (lastAssistantIndex >= 0) {
-            // Update existing assistant message with audio
-            updated[lastAssistantIndex].audio = data.data;
-            // Update text if provided and different
-            if (data.text && updated[lastAssistantIndex].text !== data.text) {
-              updated[lastAssistantIndex].text = data.text;
-            }
-          } else {
-            // Create new if somehow missing (shouldn't happen, but safety check)
-            updated.push({
-              type: 'assistant',
-              text: data.text || 'Audio response received',
-              timestamp: new Date(),
-              audio: data.data
-            });
-          }
-          return updated;
-        });
-        
-        // Check for confirmation requirement (again, in case not set earlier)
-        if (data.awaiting_confirmation && data.consequence_info) {
-          setRequiresConfirmation(true);
-          setConsequenceInfo(data.consequence_info);
-        }
         
-        // Play audio response
-        playAudio(data.data);
+        audioPlayer.startStream();
+      } else if (data.type === 'audio_end') {
+        audioPlayer.finishStream();
       } else if (data.type === 'error') {
         setIsProcessing(false);
+        stopAudio();
         onError?.(data.message);
       }
     };
@@ -262,22 +229,11 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
       mediaRecorder.onstop = async () => {
         const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' });
         
-        // Convert to base64
-        const reader = new FileReader();
-        reader.onloadend = () => {
-          const base64Audio = reader.result as string;
-          
-          // Send to WebSocket
-          if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
-            setIsProcessing(true);
-            wsRef.current.send(JSON.stringify({
-              type: 'audio',
-              data: base64Audio,
-              format: 'webm'
-            }));
-          }
-        };
-        reader.readAsDataURL(audioBlob);
+        // Send raw audio as a binary frame (no base64 expansion)
+        if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+          setIsProcessing(true);
+          wsRef.current.send(audioBlob);
+        }
         
         // Stop all tracks
         stream.getTracks().forEach(track => track.stop());
@@ -315,44 +271,6 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
     }
   };
 
-  // Play audio response
-  const playAudio = (base64Audio: string) => {
-    // Stop any currently playing audio
-    stopAudio();
-    
-    const audio = new Audio(`data:audio/mp3;base64,${base64Audio}`);
-    currentAudioRef.current = audio;
-    
-    audio.onplay = () => {
-      setIsSpeaking(true);
-    };
-    
-    audio.onended = () => {
-      setIsSpeaking(false);
-    };
-    
-    audio.onerror = (error) => {
-      console.error('❌ Audio playback error:', error);
-      setIsSpeaking(false);
-      onError?.('Failed to play audio response');
-    };
-    
-    audio.play().catch(error => {
-      console.error('❌ Failed to play audio:', error);
-      setIsSpeaking(false);
-    });
-  };
-
-  // Stop audio playback
-  const stopAudio = () => {
-    if (currentAudioRef.current) {
-      currentAudioRef.current.pause();
-      currentAudioRef.current.currentTime = 0;
-      currentAudioRef.current = null;
-      setIsSpeaking(false);
-    }
-  };
-
   // Send confirmation response
   const sendConfirmation = async (confirmed: boolean) => {
     const confirmMessage = confirmed ? 'yes' : 'no';
@@ -410,7 +328,7 @@ export function useVoiceChat({ sessionId, contextPage, onError }: UseVoiceChatOp
           audio: audioData.audio_base64
         }]);
         
-        playAudio(audioData.audio_base64);
+        audioPlayer.playBase64(audioData.audio_base64);
         setIsProcessing(false);
       } catch (error) {
         console.error('Error sending confirmation:', error);
@@ -1,4 +1,5 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
+import { createStreamAudioPlayer } from '@/lib/streamAudioPlayer';
 
 const API_URL = import.meta.env.VITE_API_URL;
 
@@ -27,7 +28,19 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
   const recorderRef = useRef<MediaRecorder | null>(null);
   const audioDataRef = useRef<Blob[]>([]);
   const audioContextInstanceRef = useRef<AudioContext | null>(null);
-  const activeAudioRef = useRef<HTMLAudioElement | null>(null);
+  
+  // TTS playback (streamed over the WebSocket, or a complete clip for confirmations)
+  const [audioPlayer] = useState(() => createStreamAudioPlayer({
+    onStart: () => {
+      setSpeakingActive(true);
+      console.log('🔊 Playing audio');
+    },
+    onEnd: () => {
+      setSpeakingActive(false);
+    },
+    onError: (message) => onError?.(message)
+  }));
+  const stopAudio = audioPlayer.stop;
 
   // Initialize WebSocket connection
   const connectWebSocket = useCallback(() => {
@@ -39,6 +52,8 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
     
     const wsUrl = API_URL.replace('http', 'ws') + '/movi/voice';
     const ws = new WebSocket(wsUrl);
+    // TTS audio arrives as binary frames
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
       console.log('🎤 Voice WebSocket connected');
@@ -51,6 +66,11 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
     };
 
     ws.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        audioPlayer.appendChunk(new Uint8Array(event.data));
+        return;
+      }
+      
       const data = JSON.parse(event.data);
       
       if (data.type === 'ready') {
@@ -63,16 +83,15 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
           text: data.text,
           timestamp: new Date()
         }]);
-      } else if (data.type === 'audio_response') {
-        console.log('🔊 Received audio response');
+      } else if (data.type === 'response') {
+        console.log('💬 Received response');
         setProcessingActive(false);
         
-        // Add assistant message to chat
+        // Reply text arrives before its audio; show it right away
         setVoiceMessages(prev => [...prev, {
           type: 'assistant',
           text: data.text,
-          timestamp: new Date(),
-          audio: data.data
+          timestamp: new Date()
         }]);
         
         // Check for confirmation requirement
@@ -81,11 +100,13 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
           setConsequenceDetails(data.consequence_info);
         }
         
-        // Play audio response
-        playAudio(data.data);
+        audioPlayer.startStream();
+      } else if (data.type === 'audio_end') {
+        audioPlayer.finishStream();
       } else if (data.type === 'error') {
         console.error('❌ Voice error:', data.message);
         setProcessingActive(false);
+        stopAudio();
         onError?.(data.message);
       }
     };
@@ -191,22 +212,11 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
       mediaRecorder.onstop = async () => {
         const audioBlob = new Blob(audioDataRef.current, { type: 'audio/webm' });
         
-        // Convert to base64
-        const reader = new FileReader();
-        reader.onloadend = () => {
-          const base64Audio = reader.result as string;
-          
-          // Send to WebSocket
-          if (websocketRef.current && websocketRef.current.readyState === WebSocket.OPEN) {
-            setProcessingActive(true);
-            websocketRef.current.send(JSON.stringify({
-              type: 'audio',
-              data: base64Audio,
-              format: 'webm'
-            }));
-          }
-        };
-        reader.readAsDataURL(audioBlob);
+        // Send raw audio as a binary frame (no base64 expansion)
+        if (websocketRef.current && websocketRef.current.readyState === WebSocket.OPEN) {
+          setProcessingActive(true);
+          websocketRef.current.send(audioBlob);
+        }
         
         // Stop all tracks
         stream.getTracks().forEach(track => track.stop());
@@ -248,46 +258,6 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
     }
   };
 
-  // Play audio response
-  const playAudio = (base64Audio: string) => {
-    // Stop any currently playing audio
-    stopAudio();
-    
-    const audio = new Audio(`data:audio/mp3;base64,${base64Audio}`);
-    activeAudioRef.current = audio;
-    
-    audio.onplay = () => {
-      setSpeakingActive(true);
-      console.log('🔊 Playing audio');
-    };
-    
-    audio.onended = () => {
-      setSpeakingActive(false);
-      console.log('✅ Audio playback finished');
-    };
-    
-    audio.onerror = (error) => {
-      console.error('❌ Audio playback error:', error);
-      setSpeakingActive(false);
-      onError?.('Failed to play audio response');
-    };
-    
-    audio.play().catch(error => {
-      console.error('❌ Failed to play audio:', error);
-      setSpeakingActive(false);
-    });
-  };
-
-  // Stop audio playback
-  const stopAudio = () => {
-    if (activeAudioRef.current) {
-      activeAudioRef.current.pause();
-      activeAudioRef.current.currentTime = 0;
-      activeAudioRef.current = null;
-      setSpeakingActive(false);
-    }
-  };
-
   // Send confirmation response
   const sendConfirmation = async (confirmed: boolean) => {
     const confirmMessage = confirmed ? 'yes' : 'no';
@@ -345,7 +315,7 @@ export function useVoiceInteraction({ sessionId, contextPage, onError }: VoiceIn
           audio: audioData.audio_base64
         }]);
         
-        playAudio(audioData.audio_base64);
+        audioPlayer.playBase64(audioData.audio_base64);
         setProcessingActive(false);
       } catch (error) {
         console.error('Error sending confirmation:', error);
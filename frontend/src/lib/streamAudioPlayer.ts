@@ -0,0 +1,124 @@
+// Plays TTS replies, either a complete base64 clip or MP3 chunks streamed over the voice WebSocket
+
+export interface StreamAudioPlayerCallbacks {
+  onStart?: () => void;
+  onEnd?: () => void;
+  onError?: (message: string) => void;
+}
+
+export interface StreamAudioPlayer {
+  playBase64: (base64Audio: string) => void;
+  startStream: () => void;
+  appendChunk: (chunk: Uint8Array) => void;
+  finishStream: () => void;
+  stop: () => void;
+}
+
+export function createStreamAudioPlayer({ onStart, onEnd, onError }: StreamAudioPlayerCallbacks = {}): StreamAudioPlayer {
+  let currentAudio: HTMLAudioElement | null = null;
+  let mediaSource: MediaSource | null = null;
+  let sourceBuffer: SourceBuffer | null = null;
+  let queue: Uint8Array[] = [];
+  let streamEnded = false;
+
+  // Start playback on an audio element
+  const startPlayback = (audio: HTMLAudioElement) => {
+    currentAudio = audio;
+
+    audio.onplay = () => {
+      onStart?.();
+    };
+
+    audio.onended = () => {
+      onEnd?.();
+    };
+
+    audio.onerror = (error) => {
+      console.error('❌ Audio playback error:', error);
+      onEnd?.();
+      onError?.('Failed to play audio response');
+    };
+
+    audio.play().catch(error => {
+      console.error('❌ Failed to play audio:', error);
+      onEnd?.();
+    });
+  };
+
+  // Feed queued chunks into the MediaSource one append at a time
+  const flushQueue = () => {
+    if (!mediaSource || !sourceBuffer || sourceBuffer.updating || mediaSource.readyState !== 'open') {
+      return;
+    }
+
+    const next = queue.shift();
+    if (next) {
+      sourceBuffer.appendBuffer(next);
+    } else if (streamEnded) {
+      mediaSource.endOfStream();
+    }
+  };
+
+  // Stop audio playback and drop any pending chunks
+  const stop = () => {
+    mediaSource = null;
+    sourceBuffer = null;
+    queue = [];
+
+    if (currentAudio) {
+      currentAudio.pause();
+      currentAudio.currentTime = 0;
+      currentAudio = null;
+      onEnd?.();
+    }
+  };
+
+  // Play a complete audio response
+  const playBase64 = (base64Audio: string) => {
+    stop();
+    startPlayback(new Audio(`data:audio/mp3;base64,${base64Audio}`));
+  };
+
+  // Begin a streamed audio response (plays as chunks arrive where MediaSource supports MP3)
+  const startStream = () => {
+    stop();
+    streamEnded = false;
+
+    if (!('MediaSource' in window) || !MediaSource.isTypeSupported('audio/mpeg')) {
+      // Fallback: buffer chunks and play once the stream ends
+      return;
+    }
+
+    const source = new MediaSource();
+    mediaSource = source;
+    source.addEventListener('sourceopen', () => {
+      if (mediaSource !== source) {
+        return; // Stopped before the source opened
+      }
+      sourceBuffer = source.addSourceBuffer('audio/mpeg');
+      sourceBuffer.addEventListener('updateend', flushQueue);
+      flushQueue();
+    });
+
+    startPlayback(new Audio(URL.createObjectURL(source)));
+  };
+
+  const appendChunk = (chunk: Uint8Array) => {
+    queue.push(chunk);
+    flushQueue();
+  };
+
+  const finishStream = () => {
+    streamEnded = true;
+
+    if (mediaSource) {
+      flushQueue();
+    } else if (queue.length > 0) {
+      const blob = new Blob(queue, { type: 'audio/mpeg' });
+      queue = [];
+      startPlayback(new Audio(URL.createObjectURL(blob)));
+    }
+  };
+
+  return { playBase64, startStream, appendChunk, finishStream, stop };
+}